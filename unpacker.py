@@ -1,50 +1,157 @@
 #!/usr/bin/env python3
 
 from tpk.tpk.decoder import TPKDecoder
-from PIL import Image, ImageOps
+from PIL import Image
 from termcolor import cprint
+import numpy as np
+import orjson
+import ijson
 
 import os
-import json
 import subprocess
 import sys
 import argparse
+import asyncio
 import tempfile
+import mmap
+import struct
+import threading
 import glob
+import re
+from array import array
+from pathlib import Path
+from typing import List, Optional, Tuple, Union
+from concurrent.futures import ThreadPoolExecutor
+
+# Binary frame table handed from unpack_tpk to extract_frames: a header of magic and frame count, one packed record
+# per frame, then every file name as a length-prefixed UTF-8 string
+FRAME_TABLE_HEADER = struct.Struct("<4sI")
+FRAME_TABLE_MAGIC = b"FRMS"
+FRAME_TABLE_RECORD = np.dtype([
+    ("x", "<i4"), ("y", "<i4"), ("w", "<i4"), ("h", "<i4"),
+    ("sprite_source_x", "<i4"), ("sprite_source_y", "<i4"),
+    ("source_w", "<i4"), ("source_h", "<i4"),
+    ("rotated", "?"),
+])
+FRAME_TABLE_FILENAME_LENGTH = struct.Struct("<H")
+
+# Frame interval sidecar: a single little-endian int, in milliseconds
+INTERVAL_FORMAT = struct.Struct("<i")
+
+# Frame file names picked up by create_gif, same as the "[a-z_]*_[0-9][0-9][0-9][0-9].png" glob ImageMagick used
+FRAME_FILENAME_PATTERN = re.compile(r"[a-z_].*_[0-9]{4}\.png")
+
+# Palette index reserved for transparent pixels in GIFs using a shared palette
+GIF_TRANSPARENT_INDEX = 255
 
 def path_to_filename_without_extension(path: str) -> str:
     return os.path.splitext(os.path.basename(path))[0]
 
-def convert_jxr_to_png(jxr_path: str, png_path: str) -> None:
+async def convert_jxr_to_png_async(jxr_path: str, png_path: str, keep_image: bool = True) -> Optional[Image.Image]:
     """
-    Convert a JXR image to PNG format.
+    Convert a JXR image to PNG format without blocking the event loop.
 
     Args:
         jxr_path (str): The path to the JXR image file.
         png_path (str): The path to save the converted PNG image.
+        keep_image (bool, optional): Whether to return the decoded image. Defaults to True.
 
     Returns:
-        None
+        Optional[Image.Image]: The decoded image in RGBA mode, so callers don't have to read the PNG back,
+            or None if `keep_image` is False.
     """
 
-    # ImageMagick can't convert directly, so we use JXRDecApp to convert
-    # to TIFF, and then from there to PNG
-    # oh, and Pillow also can't handle JXR
+    # Pillow can't handle JXR, so we use JXRDecApp to convert to TIFF and
+    # decode that in-process. JXRDecApp picks its output format from the
+    # file extension, so it can't be piped through stdout.
 
     print("Converting " + jxr_path + " to " + png_path)
 
-    # temp path for tiff file
-    tempdir = tempfile.TemporaryDirectory()
-    tiff_path = tempdir.name + "/" + path_to_filename_without_extension(jxr_path) + ".tif"
+    with tempfile.TemporaryDirectory() as tempdir:
+        tiff_path = os.path.join(tempdir, path_to_filename_without_extension(jxr_path) + ".tif")
+
+        command = [os.path.dirname(os.path.realpath(__file__)) + "/.native/JXRDecApp", "-i", jxr_path, "-o", tiff_path]
+        process = await asyncio.create_subprocess_exec(*command)
+        await process.communicate()
+        if process.returncode != 0:
+            raise subprocess.CalledProcessError(process.returncode, command)
+
+        def save_png() -> Optional[Image.Image]:
+            # The image must be closed before the temporary directory is removed
+            with Image.open(tiff_path) as image:
+                image.save(png_path, "PNG")
+                return image.convert('RGBA') if keep_image else None
 
-    subprocess.run([os.path.dirname(os.path.realpath(__file__)) + "/.native/JXRDecApp", "-i", jxr_path, "-o", tiff_path])
-    subprocess.run(["magick", "convert", tiff_path, png_path])
-    os.remove(tiff_path)
-    tempdir.cleanup()
+        image = await asyncio.to_thread(save_png)
 
     print("Converted " + jxr_path + " to " + png_path)
 
-def unpack_tpk(path: str, output_dir: str, keep_jxr: bool = False) -> None:
+    return image
+
+def convert_jxr_to_png(jxr_path: str, png_path: str, keep_image: bool = True) -> Optional[Image.Image]:
+    """
+    Convert a JXR image to PNG format.
+
+    Args:
+        jxr_path (str): The path to the JXR image file.
+        png_path (str): The path to save the converted PNG image.
+        keep_image (bool, optional): Whether to return the decoded image. Defaults to True.
+
+    Returns:
+        Optional[Image.Image]: The decoded image in RGBA mode, so callers don't have to read the PNG back,
+            or None if `keep_image` is False.
+    """
+
+    return asyncio.run(convert_jxr_to_png_async(jxr_path, png_path, keep_image))
+
+async def unpack_tpk_async(path: str, output_dir: str, keep_jxr: bool = False, frame_table: bool = False, keep_sprite_sheet: bool = True) -> Optional[Image.Image]:
+    """
+    Unpacks a TPK file located at `path` into the `output_dir` directory without blocking the event loop.
+
+    Args:
+        path (str): The path to the TPK file.
+        output_dir (str): The directory where the extracted contents will be saved.
+        keep_jxr (bool, optional): Whether to keep the JXR file after converting it to PNG. Defaults to False.
+        frame_table (bool, optional): Whether to also write the binary frame table used by extract_frames.
+            Defaults to False.
+        keep_sprite_sheet (bool, optional): Whether to return the decoded sprite sheet. Defaults to True.
+
+    Returns:
+        Optional[Image.Image]: The decoded sprite sheet in RGBA mode, or None if `keep_sprite_sheet` is False.
+    """
+    print("Unpacking " + path)
+    decoder = await asyncio.to_thread(TPKDecoder.from_file, path)
+    stem = os.path.join(output_dir, path_to_filename_without_extension(path))
+    json_path = stem + ".json"
+    jxr_path = stem + ".jxr"
+    png_path = stem + ".png"
+    scale_path = stem + ".scale.json"
+    interval_path = stem + ".interval.bin"
+    frame_table_path = stem + ".frames"
+
+    await asyncio.to_thread(decoder.export_json, json_path)
+    await asyncio.to_thread(decoder.export_atlas, jxr_path)
+
+    conversion = convert_jxr_to_png_async(jxr_path, png_path, keep_sprite_sheet)
+    if frame_table:
+        # Parse the JSON while JXRDecApp is decoding the atlas
+        sprite_sheet, _ = await asyncio.gather(conversion, asyncio.to_thread(export_frame_table, json_path, frame_table_path))
+    else:
+        sprite_sheet = await conversion
+
+    if not keep_jxr:
+        os.remove(jxr_path)
+
+    with open(scale_path, 'wb') as file:
+        file.write(orjson.dumps(decoder.scale, option=orjson.OPT_INDENT_2))
+
+    Path(interval_path).write_bytes(INTERVAL_FORMAT.pack(int(decoder.interval)))
+
+    print("Unpacked " + path)
+
+    return sprite_sheet
+
+def unpack_tpk(path: str, output_dir: str, keep_jxr: bool = False, frame_table: bool = False) -> Image.Image:
     """
     Unpacks a TPK file located at `path` and saves the extracted contents to the `output_dir` directory.
     
@@ -52,38 +159,177 @@ def unpack_tpk(path: str, output_dir: str, keep_jxr: bool = False) -> None:
         path (str): The path to the TPK file.
         output_dir (str): The directory where the extracted contents will be saved.
         keep_jxr (bool, optional): Whether to keep the JXR file after converting it to PNG. Defaults to False.
+        frame_table (bool, optional): Whether to also write the binary frame table used by extract_frames.
+            Defaults to False.
     
+    Returns:
+        Image.Image: The decoded sprite sheet in RGBA mode.
+    """
+
+    return asyncio.run(unpack_tpk_async(path, output_dir, keep_jxr, frame_table))
+
+async def unpack_tpk_many(paths: List[str], output_dir: str, keep_jxr: bool = False, keep_sprite_sheets: bool = False, frame_tables: bool = False) -> List[Union[Optional[Image.Image], BaseException]]:
+    """
+    Unpacks several TPK files concurrently, running at most one per CPU at a time.
+
+    Args:
+        paths (List[str]): The paths to the TPK files.
+        output_dir (str): The directory where the extracted contents will be saved.
+        keep_jxr (bool, optional): Whether to keep the JXR files after converting them to PNG. Defaults to False.
+        keep_sprite_sheets (bool, optional): Whether to return the decoded sprite sheets, which holds all of them
+            in memory at once. Defaults to False.
+        frame_tables (bool, optional): Whether to also write the binary frame tables used by extract_frames.
+            Defaults to False.
+
+    Returns:
+        List[Union[Optional[Image.Image], BaseException]]: For each path, the decoded sprite sheet (or None if
+            `keep_sprite_sheets` is False) if it was unpacked, otherwise the exception it raised.
+    """
+
+    semaphore = asyncio.Semaphore(os.cpu_count() or 1)
+
+    async def unpack(path: str) -> Optional[Image.Image]:
+        async with semaphore:
+            return await unpack_tpk_async(path, output_dir, keep_jxr, frame_tables, keep_sprite_sheets)
+
+    return await asyncio.gather(*(unpack(path) for path in paths), return_exceptions=True)
+
+# Pillow-SIMD is a drop-in replacement for Pillow on x86_64/AMD64 that vectorizes its mode
+# conversions: the RGBA convert here and in convert_jxr_to_png_async, and the RGB convert
+# before palette mapping in create_gif.
+#   pip uninstall pillow && pip install pillow-simd
+# It only ships SSE4/AVX2 code paths, so stock Pillow stays the fallback on ARM.
+# Building Pillow against zlib-ng also speeds up the DEFLATE and CRC32 of final PNG frames.
+def image_to_array(image: Image.Image) -> np.ndarray:
+    """
+    Copies an image's pixels into a (height, width, 4) RGBA array in a single pass.
+
+    Args:
+        image (Image.Image): The image to copy, converted to RGBA first if needed.
+
+    Returns:
+        np.ndarray: The image's pixels.
+    """
+
+    if image.mode != 'RGBA':
+        image = image.convert('RGBA')
+
+    return np.frombuffer(image.tobytes(), dtype=np.uint8).reshape(image.height, image.width, 4)
+
+def load_atlas(sprite_sheet: Union[str, Image.Image, np.ndarray]) -> np.ndarray:
+    """
+    Loads a sprite sheet as RGBA pixels.
+
+    Args:
+        sprite_sheet (Union[str, Image.Image, np.ndarray]): The path to the PNG file containing the sprite sheet,
+            the decoded sprite sheet, or a sprite sheet already loaded by this function.
+
+    Returns:
+        np.ndarray: The sprite sheet as a (height, width, 4) array.
+    """
+
+    if isinstance(sprite_sheet, np.ndarray):
+        return sprite_sheet
+
+    if isinstance(sprite_sheet, Image.Image):
+        return image_to_array(sprite_sheet)
+
+    with Image.open(sprite_sheet) as image:
+        return image_to_array(image)
+
+def export_frame_table(json_file: str, frame_table_file: str) -> None:
+    """
+    Converts the frame table of a sprite sheet's JSON into the binary format read by load_frame_table.
+
+    Args:
+        json_file (str): The path to the JSON file containing frame data.
+        frame_table_file (str): The path to save the binary frame table.
+
     Returns:
         None
     """
-    print("Unpacking " + path)
-    decoder = TPKDecoder.from_file(path)
-    filename = path_to_filename_without_extension(path)
 
-    decoder.export_json(output_dir + "/" + filename + ".json")
-    decoder.export_atlas(output_dir + "/" + filename + ".jxr")
+    # Stream the frame table so only one frame dict is alive at a time,
+    # collecting one compact array per field
+    filenames = []
+    xs, ys, ws, hs = array('i'), array('i'), array('i'), array('i')
+    sprite_source_xs, sprite_source_ys = array('i'), array('i')
+    source_widths, source_heights = array('i'), array('i')
+    rotated = array('b')
 
-    convert_jxr_to_png(output_dir + "/" + filename + ".jxr", output_dir + "/" + filename + ".png")
+    with open(json_file, 'rb') as f:
+        for frame_data in ijson.items(f, "frames.item"):
+            frame_info = frame_data['frame']
+            filenames.append(frame_data['filename'])
+            xs.append(frame_info['x'])
+            ys.append(frame_info['y'])
+            ws.append(frame_info['w'])
+            hs.append(frame_info['h'])
+            sprite_source_xs.append(frame_data['spriteSourceSize']['x'])
+            sprite_source_ys.append(frame_data['spriteSourceSize']['y'])
+            source_widths.append(frame_data['sourceSize']['w'])
+            source_heights.append(frame_data['sourceSize']['h'])
+            rotated.append(frame_data.get('rotated', False))  # Check if the frame is rotated
+
+    frames = np.empty(len(filenames), dtype=FRAME_TABLE_RECORD)
+    frames['x'], frames['y'], frames['w'], frames['h'] = xs, ys, ws, hs
+    frames['sprite_source_x'], frames['sprite_source_y'] = sprite_source_xs, sprite_source_ys
+    frames['source_w'], frames['source_h'] = source_widths, source_heights
+    frames['rotated'] = rotated
+
+    with open(frame_table_file, 'wb') as f:
+        f.write(FRAME_TABLE_HEADER.pack(FRAME_TABLE_MAGIC, len(frames)))
+        f.write(frames.tobytes())
+        for filename in filenames:
+            encoded = filename.encode('utf-8')
+            f.write(FRAME_TABLE_FILENAME_LENGTH.pack(len(encoded)))
+            f.write(encoded)
+
+def load_frame_table(frame_table_file: str) -> Tuple[List[str], np.ndarray]:
+    """
+    Loads a binary frame table written by export_frame_table, reading the records in place from a memory map.
 
-    if not keep_jxr:
-        os.remove(output_dir + "/" + filename + ".jxr")
+    Args:
+        frame_table_file (str): The path to the binary frame table.
 
-    with open(output_dir + "/" + filename + ".scale" + ".json", 'w') as file:
-        json.dump(decoder.scale, file, indent=4)
+    Returns:
+        Tuple[List[str], np.ndarray]: The frame file names, and one FRAME_TABLE_RECORD per frame.
+    """
 
-    with open(output_dir + "/" + filename + ".interval" + ".txt", 'w') as file:
-        file.write(str(decoder.interval))
+    with open(frame_table_file, 'rb') as f:
+        table = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
 
-    print("Unpacked " + path)
+    try:
+        magic, count = FRAME_TABLE_HEADER.unpack_from(table)
+        offset = FRAME_TABLE_HEADER.size + count * FRAME_TABLE_RECORD.itemsize
+        filenames = []
 
-def extract_frames(json_file: str, png_file: str, output_dir: str) -> None:
+        if magic == FRAME_TABLE_MAGIC and len(table) >= offset:
+            for _ in range(count):
+                length, = FRAME_TABLE_FILENAME_LENGTH.unpack_from(table, offset)
+                offset += FRAME_TABLE_FILENAME_LENGTH.size
+                filenames.append(table[offset:offset+length].decode('utf-8'))
+                offset += length
+
+            if offset == len(table):
+                return filenames, np.frombuffer(table, dtype=FRAME_TABLE_RECORD, count=count, offset=FRAME_TABLE_HEADER.size)
+    except (struct.error, UnicodeDecodeError):
+        pass
+
+    table.close()
+    raise ValueError("Invalid frame table: " + frame_table_file)
+
+def extract_frames(frame_table_file: str, sprite_sheet: Union[str, Image.Image, np.ndarray], output_dir: str, compress_level: int = 6) -> None:
     """
     Extracts frames from a sprite sheet and saves them as individual images.
 
     Args:
-        json_file (str): The path to the JSON file containing frame data.
-        png_file (str): The path to the PNG file containing the sprite sheet.
+        frame_table_file (str): The path to the binary frame table written by export_frame_table.
+        sprite_sheet (Union[str, Image.Image, np.ndarray]): The path to the PNG file containing the sprite sheet,
+            or the already decoded sprite sheet, as an image or an array from load_atlas.
         output_dir (str): The directory where the individual frames will be saved.
+        compress_level (int, optional): The PNG compression level for the frames, 0 stores them uncompressed,
+            which suits frames that only feed the GIF encoder. Defaults to 6.
 
     Returns:
         None
@@ -92,57 +338,91 @@ def extract_frames(json_file: str, png_file: str, output_dir: str) -> None:
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
 
-    print("Extracting frames from " + png_file + " using " + json_file)
-    with open(json_file, 'r') as f:
-        data = json.load(f)
-        sprite_sheet = Image.open(png_file).convert('RGBA')
-
-        for frame_data in data["frames"]:
-            filename = frame_data['filename']
-            frame_info = frame_data['frame']
-            sprite_source_size = frame_data['spriteSourceSize']
-            source_size = frame_data['sourceSize']
-            trimmed = frame_data.get('trimmed', False)  # Check if the frame is trimmed
-            rotated = frame_data.get('rotated', False)  # Check if the frame is rotated
-            x, y, w, h = frame_info['x'], frame_info['y'], frame_info['w'], frame_info['h']
-
-            spriteSourceSizeX = sprite_source_size['x']
-            spriteSourceSizeY = sprite_source_size['y']
-            spriteSourceSizeW = sprite_source_size['w']
-            spriteSourceSizeH = sprite_source_size['h']
-            sourceWidth = source_size['w']
-            sourceHeight = source_size['h']
-
-            # Crop frame from sprite sheet
-            if rotated:
-                frame = sprite_sheet.crop((x, y, x+h, y+w))  # Swap width and height for rotated frame
-                frame = frame.transpose(method=Image.ROTATE_90)  # Transpose for rotation by 90 degrees
-            else:
-                frame = sprite_sheet.crop((x, y, x+w, y+h))
-            
-            # Calculate borders based on source and sprite source size
-            left_border = spriteSourceSizeX
-            upper_border = spriteSourceSizeY
-            right_border = sourceWidth - spriteSourceSizeW - left_border
-            lower_border = sourceHeight - spriteSourceSizeH - upper_border
-            
-            # Add transparent borders to the image
-            frame = ImageOps.expand(frame, (left_border, upper_border, right_border, lower_border), fill=(0, 0, 0, 0))
+    source = sprite_sheet if isinstance(sprite_sheet, str) else "decoded sprite sheet"
+    print("Extracting frames from " + source + " using " + frame_table_file)
+    filenames, frames = load_frame_table(frame_table_file)
+    atlas = load_atlas(sprite_sheet)
+
+    # Work out every frame's crop and padding at once over the whole table,
+    # so the loop below only slices and dispatches
+    widths, heights = frames['w'], frames['h']
+    is_rotated = frames['rotated']
+    crop_ws = np.where(is_rotated, heights, widths)  # Swap width and height for rotated frames
+    crop_hs = np.where(is_rotated, widths, heights)
+    # Untrimmed frames cover the whole canvas, so there are no borders to clear
+    needs_pad = (frames['sprite_source_x'] != 0) | (frames['sprite_source_y'] != 0) | (widths != frames['source_w']) | (heights != frames['source_h'])
+
+    # Each worker thread reuses its canvas while the frame size stays the same,
+    # the frame is copied in and encoded on that thread before the next one
+    worker = threading.local()
+
+    def save_frame(frame: np.ndarray, left: int, upper: int, source_width: int, source_height: int, pad: bool, path: str) -> None:
+        canvas = getattr(worker, "canvas", None)
+        if canvas is None or canvas.shape[:2] != (source_height, source_width):
+            canvas = worker.canvas = np.zeros((source_height, source_width, 4), dtype=np.uint8)
+        elif pad:
+            canvas.fill(0)
+
+        # Copy the frame into the transparent canvas, which replaces padding it with ImageOps.expand
+        canvas[upper:upper+frame.shape[0], left:left+frame.shape[1]] = frame
+
+        # Wrap the canvas memory directly rather than letting fromarray inspect and copy it
+        Image.frombuffer("RGBA", (source_width, source_height), canvas, "raw", "RGBA", 0, 1).save(path, optimize=False, compress_level=compress_level)
+
+    # PNG encoding dominates and Pillow releases the GIL while deflating,
+    # so frames are saved on a thread pool while the next ones are cropped
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+        saves = []
+        columns = (frames['x'], frames['y'], crop_ws, crop_hs, is_rotated, frames['sprite_source_x'], frames['sprite_source_y'], frames['source_w'], frames['source_h'], needs_pad)
+        table = zip(filenames, *(column.tolist() for column in columns))
+
+        for filename, x, y, crop_w, crop_h, rotate, left, upper, source_width, source_height, pad in table:
+            # Crop frame from sprite sheet, as a view into the atlas
+            frame = atlas[y:y+crop_h, x:x+crop_w]
+            if rotate:
+                frame = np.rot90(frame)  # Rotate by 90 degrees counter-clockwise, same as Image.ROTATE_90
 
             # Save individual frame
-            frame.save(output_dir + "/" + filename)
+            saves.append(executor.submit(save_frame, frame, left, upper, source_width, source_height, pad, os.path.join(output_dir, filename)))
+
+        # Surface any exception raised while saving
+        for save in saves:
+            save.result()
 
-    print("Extracted frames from " + png_file + " using " + json_file)
+    print("Extracted frames from " + source + " using " + frame_table_file)
 
-def create_gif(input_dir: str, source_name: str, output_file: str, interval: int) -> None:
+def build_gif_palette(atlas: np.ndarray) -> Image.Image:
     """
-    Creates a GIF file from a set of PNG images using the ImageMagick command line tool.
+    Quantizes a sprite sheet once into a palette shared by every frame cut from it.
+
+    Only visible pixels are sampled, and the palette holds at most 255 colours so
+    index GIF_TRANSPARENT_INDEX stays free for transparency.
+
+    Args:
+        atlas (np.ndarray): The sprite sheet as a (height, width, 4) array.
+
+    Returns:
+        Image.Image: A paletted image to pass to create_gif.
+    """
+
+    visible = atlas[atlas[..., 3] != 0][:, :3]
+    if len(visible) == 0:
+        visible = atlas[..., :3].reshape(-1, 3)
+
+    sample = Image.fromarray(np.ascontiguousarray(visible).reshape(1, -1, 3))
+    return sample.quantize(colors=GIF_TRANSPARENT_INDEX, method=Image.Quantize.MEDIANCUT)
+
+def create_gif(input_dir: str, source_name: str, output_file: str, interval: int, palette: Optional[Image.Image] = None) -> None:
+    """
+    Creates a GIF file from a set of PNG images using Pillow's GIF encoder.
 
     Args:
         input_dir (str): The directory containing the PNG images.
         source_name (str): The name of the source file.
         output_file (str): The path and name of the output GIF file.
-        interval (int): The delay between frames in the GIF, in tenths of a second.
+        interval (int): The delay between frames in the GIF, in milliseconds.
+        palette (Image.Image, optional): A palette from build_gif_palette to map every frame onto,
+            instead of having each frame quantized separately. Defaults to None.
 
     Returns:
         None
@@ -152,27 +432,53 @@ def create_gif(input_dir: str, source_name: str, output_file: str, interval: int
         cprint("Input directory does not exist: " + input_dir, "yellow")
         return
     
-    if len(os.listdir(input_dir)) < 2:
-        cprint("Input directory contains less than 2 files: " + input_dir, "yellow")
+    # A single scandir pass over the directory, sorted the way ImageMagick's globber did
+    frame_paths = sorted(entry.path for entry in os.scandir(input_dir) if entry.is_file() and FRAME_FILENAME_PATTERN.fullmatch(entry.name))
+    if len(frame_paths) < 2:
+        cprint("Input directory contains less than 2 frames: " + input_dir, "yellow")
         return
 
-    print("Creating GIF from " + input_dir + " using " + source_name + " with interval " + str(interval) + " tenths of a second: " + output_file)
-    # HACK: Really didn't want to use magick here, but it's the only way I could get it to work
-    subprocess.run(["magick", "-delay", str(interval / 10), "-loop", "0", "-dispose", "2", input_dir + "/[a-z_]*_[0-9][0-9][0-9][0-9].png", "-coalesce", output_file])
-    print("Created GIF from " + input_dir + " using " + source_name + " with interval " + str(interval) + " tenths of a second: " + output_file)
-    pass
+    print("Creating GIF from " + input_dir + " using " + source_name + " with interval " + str(interval) + " milliseconds: " + output_file)
+
+    if palette is None:
+        # Each frame is loaded and its file closed straight away, keeping every
+        # frame open until the encoder reaches it runs out of file handles
+        frames = []
+        for frame_path in frame_paths:
+            with Image.open(frame_path) as frame:
+                frames.append(frame.copy())
+        options = {"optimize": True}
+    else:
+        # Frames are mapped onto the shared palette up front, so the encoder
+        # only runs LZW over 1 byte per pixel and never re-quantizes
+        frames = []
+        for frame_path in frame_paths:
+            with Image.open(frame_path) as frame:
+                frame = frame.convert('RGBA')
+                paletted = frame.convert('RGB').quantize(palette=palette, dither=Image.Dither.NONE)
+                paletted.paste(GIF_TRANSPARENT_INDEX, mask=frame.getchannel('A').point(lambda alpha: 255 if alpha == 0 else 0))
+                frames.append(paletted)
+        options = {"optimize": False, "transparency": GIF_TRANSPARENT_INDEX}
+
+    frames[0].save(output_file, save_all=True, append_images=frames[1:], duration=interval, loop=0, disposal=2, **options)
+
+    print("Created GIF from " + input_dir + " using " + source_name + " with interval " + str(interval) + " milliseconds: " + output_file)
 
 def main():
     """
     Unpacks TPK files and performs various operations on the extracted files.
 
     This function parses command line arguments using the argparse module to specify the input file, output directory,
-    options to keep JXR files, extract frames, and create GIFs. It then checks if the output directory exists and creates
-    it if necessary. The function calls the unpack_tpk function to unpack the TPK file, passing the input file path,
-    output directory, and the keep JXR option. If the extract frames option is specified, the function calls the
-    extract_frames function, passing the JSON file path, PNG file path, and output directory. If the create GIF option
-    is specified, the function reads the interval value from a file, converts it to an integer, and calls the create_gif
-    function, passing the output directory, GIF file name, PNG file path, and interval.
+    options to keep JXR files, extract frames, and create GIFs. The input may also be a directory of TPK files or a glob
+    pattern; inputs whose base names collide are rejected, since their outputs would overwrite each other. It then
+    checks if the output directory exists and creates it if necessary. The function calls the unpack_tpk_many function
+    to unpack every TPK file concurrently, passing the input file paths, output directory, and the keep JXR option, and
+    has it write binary frame tables when frames are to be extracted. For each unpacked file, if the extract frames
+    option is specified, the function calls the extract_frames function, passing the frame table path, sprite sheet,
+    output directory, and a PNG compression level (uncompressed when the frames only feed a GIF, unless the frames are
+    final option is specified). If the create GIF option is specified, the function reads the interval value from its
+    binary sidecar file and calls the create_gif function, passing the frames directory, source name, GIF file path,
+    interval, and a palette shared by every frame. If any input fails to unpack, the process exits with status 1.
 
     Parameters:
         None
@@ -181,28 +487,80 @@ def main():
         None
     """
     parser = argparse.ArgumentParser(description="Unpack TPK files")
-    parser.add_argument("input", type=str, help="Input file")
+    parser.add_argument("input", type=str, help="Input file, directory of TPK files, or glob pattern")
     parser.add_argument("--output", "-o", type=str, help="Output directory", required=False, default="output")
     parser.add_argument("--keep-jxr", "-k", action="store_true", help="Keep JXR files", required=False)
-    parser.add_argument("--extract-frames", "-e", action="store_true", help="Extract frames", required=False)
+    parser.add_argument("--extract-frames", "-e", action="store_true", help="Extract frames (also writes a binary <name>.frames table)", required=False)
     parser.add_argument("--create-gif", "-g", action="store_true", help="Create GIF", required=False)
+    parser.add_argument("--frames-are-final", "-f", action="store_true", help="Compress extracted frames even when they only feed the GIF", required=False)
     args = parser.parse_args()
 
+    if os.path.isdir(args.input):
+        inputs = sorted(glob.glob(os.path.join(args.input, "*.tpk")))
+    elif any(character in args.input for character in "*?["):
+        inputs = sorted(glob.glob(args.input))
+    else:
+        inputs = [args.input]
+
+    if not inputs:
+        cprint("No TPK files found: " + args.input, "yellow")
+        return
+
+    # Outputs are named after the input's base name, so two inputs sharing one
+    # would be unpacked over each other
+    inputs_by_base = {}
+    for path in inputs:
+        inputs_by_base.setdefault(path_to_filename_without_extension(path), []).append(path)
+
+    duplicates = {base: paths for base, paths in inputs_by_base.items() if len(paths) > 1}
+    if duplicates:
+        for base, paths in duplicates.items():
+            cprint("Inputs would overwrite each other's " + base + " outputs: " + ", ".join(paths), "red")
+        sys.exit(1)
+
     if not os.path.exists(args.output):
         os.makedirs(args.output)
 
-    unpack_tpk(args.input, args.output, args.keep_jxr)
+    # Hand a single input's decoded sprite sheet straight to extract_frames instead of
+    # reading the PNG back, a batch would hold every sprite sheet in memory at once
+    keep_sprite_sheets = args.extract_frames and len(inputs) == 1
+    results = asyncio.run(unpack_tpk_many(inputs, args.output, args.keep_jxr, keep_sprite_sheets, args.extract_frames))
+
+    failed = False
+
+    for path, result in zip(inputs, results):
+        if isinstance(result, BaseException):
+            # A single input fails the same way it always did, with its traceback
+            if len(inputs) == 1:
+                raise result
+
+            cprint("Failed to unpack " + path + ": " + repr(result), "red")
+            failed = True
+            continue
+
+        base = path_to_filename_without_extension(path)
+        stem = os.path.join(args.output, base)
+        frame_table_path = stem + ".frames"
+        png_path = stem + ".png"
+        interval_path = stem + ".interval.bin"
+        gif_path = stem + ".gif"
+        # Keep each TPK's frames apart when unpacking several at once
+        frames_dir = os.path.join(args.output, "frames") if len(inputs) == 1 else os.path.join(args.output, "frames", base)
+
+        if args.extract_frames:
+            # Decoded once here, so the GIF palette below reuses the same pixels
+            atlas = load_atlas(png_path if result is None else result)
 
-    if args.extract_frames:
-        extract_frames(args.output + "/" + path_to_filename_without_extension(args.input) + ".json", args.output + "/" + path_to_filename_without_extension(args.input) + ".png", args.output + "/frames")
+            # Frames that only feed the GIF encoder are stored without DEFLATE
+            extract_frames(frame_table_path, atlas, frames_dir, 0 if args.create_gif and not args.frames_are_final else 6)
 
-        if args.create_gif:
-            with open(args.output + "/" + path_to_filename_without_extension(args.input) + ".interval" + ".txt", 'r') as file:
-                intervalAsString = file.read()
+            if args.create_gif:
+                interval, = INTERVAL_FORMAT.unpack(Path(interval_path).read_bytes())
 
-                interval = int(intervalAsString)
+                create_gif(frames_dir, base, gif_path, interval, build_gif_palette(atlas))
 
-                create_gif(args.output + "/frames", path_to_filename_without_extension(args.input), args.output + "/" + path_to_filename_without_extension(args.input) + ".gif", interval)
+    if failed:
+        sys.exit(1)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file